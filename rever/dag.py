@@ -1,4 +1,182 @@
 """Tools for dealing with activity DAGs."""
+import hashlib
+
+
+class DAGCycleError(ValueError):
+    """Error for when activities depend on each other in a cycle."""
+
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super().__init__('activities have a cyclic dependency: ' +
+                         ' -> '.join(cycle))
+
+
+class CompiledDAG:
+    """The part of an activity DAG that is reachable from a set of end
+    points, validated and indexed once so that paths through it may be
+    computed without recursion.
+    """
+
+    def __init__(self, dag, ends):
+        """
+        Parameters
+        ----------
+        dag : dict of names to activities
+            A DAG of all possible activities
+        ends : set of str
+            End points that will be computed.
+
+        Raises
+        ------
+        DAGCycleError
+            If the reachable activities have a cyclic dependency.
+        """
+        self.ends = frozenset(ends)
+        self.deps = {}
+        self.missing = set()
+        stack = sorted(self.ends)
+        while stack:
+            name = stack.pop()
+            if name in self.deps or name in self.missing:
+                continue
+            try:
+                deps = frozenset(dag[name].deps)
+            except KeyError:
+                # missing activities are only an error if they are needed
+                self.missing.add(name)
+                continue
+            self.deps[name] = deps
+            stack.extend(deps)
+        self.order = self._toposort()
+        self.index = {name: i for i, name in enumerate(self.order)}
+        self.signature = self.compute_signature(dag)
+
+    def _toposort(self):
+        """Orders the activities with Kahn's algorithm."""
+        waiting = {}
+        children = {name: [] for name in self.deps}
+        for name, deps in self.deps.items():
+            deps = [d for d in deps if d in self.deps]
+            waiting[name] = len(deps)
+            for d in deps:
+                children[d].append(name)
+        ready = sorted([name for name, n in waiting.items() if n == 0], reverse=True)
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for c in children[name]:
+                waiting[c] -= 1
+                if waiting[c] == 0:
+                    ready.append(c)
+        if len(order) < len(self.deps):
+            raise DAGCycleError(self._find_cycle(set(self.deps) - set(order)))
+        return order
+
+    def _find_cycle(self, remaining):
+        """Finds a cycle among activities that could not be ordered."""
+        name = min(remaining)
+        seen = []
+        while name not in seen:
+            seen.append(name)
+            name = min(d for d in self.deps[name] if d in remaining)
+        # show the cycle in execution order, dependencies first
+        cycle = seen[seen.index(name):][::-1]
+        i = cycle.index(min(cycle))
+        cycle = cycle[i:] + cycle[:i]
+        return cycle + [cycle[0]]
+
+    def compute_signature(self, dag):
+        """Returns a value that changes if the activities or their
+        dependencies in the DAG change.
+        """
+        sig = []
+        for name in self.order:
+            act = dag.get(name, None)
+            sig.append((name, id(act), frozenset(getattr(act, 'deps', ()))))
+        return tuple(sig)
+
+    def deps_of(self, name):
+        """Returns the dependencies of an activity."""
+        try:
+            return self.deps[name]
+        except KeyError:
+            raise KeyError('{0!r} not found in DAG!'.format(name))
+
+    def find_path(self, ends, done=frozenset(), path=None, already_done=None):
+        """Returns a list that includes all end points. This has the same
+        parameters and return values as ``find_path()``.
+        """
+        if path is None:
+            path = []
+        if not isinstance(done, frozenset):
+            done = frozenset(done)
+        if already_done is None:
+            already_done = []
+        in_path = set(path)
+        seen = set(already_done)
+
+        def mark(names):
+            for x in sorted(names):
+                if x not in seen:
+                    seen.add(x)
+                    already_done.append(x)
+
+        mark((ends - in_path) & done)
+        # depth first search, visiting dependencies in sorted order
+        stack = [(None, iter(sorted(ends - done - in_path)))]
+        while stack:
+            name, todo = stack[-1]
+            for child in todo:
+                if child in in_path:
+                    continue
+                deps = self.deps_of(child)
+                mark(deps & done)
+                stack.append((child, iter(sorted(deps - done - in_path))))
+                break
+            else:
+                stack.pop()
+                if name is not None and name not in in_path:
+                    in_path.add(name)
+                    path.append(name)
+        return path, already_done
+
+
+# maps (rc file hash, end points) to compiled DAGs
+_COMPILED = {}
+
+
+def rc_hash(filename):
+    """Returns the SHA-256 hash of a run control file, or None if it does
+    not exist.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def compile_dag(dag, ends, rc=None):
+    """Returns a compiled DAG for a set of end points. Compiled DAGs are
+    cached per run control file hash and end points, and are recompiled if
+    the activities in the DAG have changed.
+
+    Parameters
+    ----------
+    dag : dict of names to activities
+        A DAG of all possible activities
+    ends : set of str
+        End points that will be computed.
+    rc : str or None, optional
+        Path to the run control file that defined the DAG.
+    """
+    key = (rc_hash(rc) if rc else None, frozenset(ends))
+    compiled = _COMPILED.get(key, None)
+    if compiled is not None and compiled.compute_signature(dag) == compiled.signature:
+        return compiled
+    compiled = _COMPILED[key] = CompiledDAG(dag, ends)
+    return compiled
 
 
 def find_path(dag, ends, done=frozenset(), path=None, already_done=None):
@@ -25,31 +203,82 @@ def find_path(dag, ends, done=frozenset(), path=None, already_done=None):
     already_done : list of str
         Activities that have already been computed that would otherwise need to
         be computed.
+
+    Raises
+    ------
+    DAGCycleError
+        If the activities have a cyclic dependency.
     """
-    if path is None:
-        path = []
-    if not isinstance(done, frozenset):
-        done = frozenset(done)
-    if already_done is None:
-        already_done = []
-    pth = set(path)
-    sofar = pth | done
-    todo = ends - sofar
-    would_do = (ends - pth) & done
-    already_done.extend([x for x in sorted(would_do) if x not in already_done])
-    if len(todo) == 0:
-        return path, already_done
-    for end in sorted(todo):
-        try:
-            deps = set(dag[end].deps)
-        except KeyError:
-            # we need to do it this way to support defaultdict
-            raise KeyError('{0!r} not found in DAG!'.format(end))
-        need = deps - sofar
-        already_done.extend([x for x in sorted(deps & done) if x not in already_done])
-        if len(need) > 0:
-            find_path(dag, need, done=done, path=path, already_done=already_done)
-            sofar.update(path)
-        if end not in sofar:
-            path.append(end)
-    return path, already_done
+    return CompiledDAG(dag, ends).find_path(ends, done=done, path=path,
+                                            already_done=already_done)
+
+
+def critical_path_order(dag, activities, durations, default=0.0):
+    """Orders activities so that, of the activities whose dependencies have
+    been met, the one with the longest critical path through the rest of the
+    DAG comes first. This is used to report on a release with ``--plan``, the
+    activities of a release are still run in the ``$ACTIVITIES`` order.
+
+    Parameters
+    ----------
+    dag : dict of names to activities
+        A DAG of all possible activities
+    activities : list of str
+        Activities to order. Dependencies that are not in this list are
+        assumed to be met. Ties are broken by the order of this list.
+    durations : dict of str to float
+        Expected duration of each activity, e.g. the median historical
+        duration.
+    default : float, optional
+        The duration of activities that are not in durations.
+
+    Returns
+    -------
+    order : list of str
+        The activities, in scheduled order.
+    levels : dict of str to float
+        Maps each activity to the length of the longest path through the
+        DAG that starts with it, including its own duration.
+    critical_path : list of str
+        The longest path through the DAG.
+
+    Raises
+    ------
+    DAGCycleError
+        If the activities have a cyclic dependency.
+    """
+    compiled = compile_dag(dag, set(activities))
+    position = {name: i for i, name in enumerate(activities)}
+    deps = {}
+    children = {name: [] for name in activities}
+    for name in activities:
+        deps[name] = {d for d in compiled.deps_of(name) if d in position}
+        for d in deps[name]:
+            children[d].append(name)
+    # compute levels in reverse topological order
+    levels = {}
+    for name in reversed(compiled.order):
+        if name not in position:
+            continue
+        below = [levels[c] for c in children[name]]
+        levels[name] = durations.get(name, default) + max(below, default=0.0)
+    # list schedule by priority
+    waiting = {name: len(deps[name]) for name in activities}
+    ready = [name for name in activities if waiting[name] == 0]
+    order = []
+    while ready:
+        name = min(ready, key=lambda n: (-levels[n], position[n]))
+        ready.remove(name)
+        order.append(name)
+        for c in children[name]:
+            waiting[c] -= 1
+            if waiting[c] == 0:
+                ready.append(c)
+    # follow the critical path from the start
+    critical_path = []
+    nexts = [name for name in activities if len(deps[name]) == 0]
+    while nexts:
+        name = min(nexts, key=lambda n: (-levels[n], position[n]))
+        critical_path.append(name)
+        nexts = children[name]
+    return order, levels, critical_path
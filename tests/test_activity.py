@@ -28,6 +28,11 @@ def test_do_undo(gitrepo):
     assert entries[1]['category'] == 'activity-end'
     assert entries[0]['rev'] != entries[1]['rev']
     assert entries[1]['rev'] == vcsutils.current_rev()
+    data = entries[1]['data']
+    assert data['status'] == 'success'
+    assert data['wall_time'] >= 0.0
+    assert data['cpu_time'] >= 0.0
+    assert data['subprocess_counts']['git'] == data['subprocesses'] >= 2
     with open('tryptophan.txt') as f:
         value = f.read()
     assert value == '5-HTP\n'
@@ -43,6 +48,103 @@ def test_do_undo(gitrepo):
     assert not os.path.isfile('tryptophan.txt')
 
 
+def test_error_timing(gitrepo):
+    def fail():
+        raise ValueError('nope')
+    logger = builtins.__xonsh__.env['LOGGER']
+    act = Activity(name='failure', func=fail)
+    assert not act()
+    entries = logger.load()
+    assert entries[-1]['category'] == 'activity-error'
+    data = entries[-1]['data']
+    assert data['status'] == 'error'
+    assert data['exception'] == 'ValueError'
+    assert data['wall_time'] >= 0.0
+
+
+def test_fingerprint_skip(gitrepo):
+    env = builtins.__xonsh__.env
+    logger = env['LOGGER']
+    runs = []
+    os.makedirs('docs')
+    with open(os.path.join('docs', 'index.rst'), 'w') as f:
+        f.write('hello\n')
+    act = Activity(name='build', func=lambda: runs.append(1),
+                   inputs=['docs/**/*.rst'], input_env=['BUILD_FLAGS'])
+    fp = act.fingerprint()
+    assert len(fp) == 64
+    assert act()
+    assert logger.load()[-1]['data']['fingerprint'] == fp
+    # unchanged inputs skip the activity, even for another version
+    env['VERSION'] = '4.2'
+    assert act()
+    assert len(runs) == 1
+    entry = logger.load()[-1]
+    assert entry['category'] == 'activity-end'
+    assert entry['version'] == '4.2'
+    assert entry['data']['status'] == 'skipped'
+    assert entry['data']['skipped_from'] == 'x.y.z'
+    # changing a file or an environment variable runs it again
+    with open(os.path.join('docs', 'index.rst'), 'a') as f:
+        f.write('world\n')
+    assert act.fingerprint() != fp
+    assert act()
+    assert len(runs) == 2
+    env['BUILD_FLAGS'] = ['-W']
+    assert act()
+    assert len(runs) == 3
+    # forcing runs it again
+    env['REVER_FORCED'] = True
+    assert act()
+    assert len(runs) == 4
+    env['REVER_FORCED'] = False
+    del env['BUILD_FLAGS']
+    # activities without inputs always run
+    assert Activity(name='plain').fingerprint() is None
+
+
+def test_checkpoint(gitrepo):
+    env = builtins.__xonsh__.env
+    logger = env['LOGGER']
+    calls = []
+
+    def fetch():
+        calls.append('fetch')
+        return {'url': 'https://example.com', 'sha': 'abc'}
+
+    def publish(fail):
+        calls.append('publish')
+        if fail:
+            raise RuntimeError('publish failed')
+
+    outputs = []
+
+    def func(fail=False):
+        outputs.append(act.checkpoint('fetch', fetch))
+        act.checkpoint('publish', publish, fail)
+
+    act = Activity(name='release', func=func, kwargs={'fail': True})
+    assert not act()
+    assert calls == ['fetch', 'publish']
+    assert act.completed_steps() == {'fetch': outputs[0]}
+    # the fetch step is skipped when trying again
+    act.kwargs = {'fail': False}
+    assert act()
+    assert calls == ['fetch', 'publish', 'publish']
+    assert outputs[1] == outputs[0]
+    steps = [e['data']['step'] for e in logger.query(category='activity-step')]
+    assert steps == ['fetch', 'publish']
+    # once the activity is done, the next run does all of the steps
+    assert act.completed_steps() == {}
+    assert act()
+    assert calls == ['fetch', 'publish', 'publish', 'fetch', 'publish']
+    # resetting the checkpoints
+    act.kwargs = {'fail': True}
+    assert not act()
+    act.reset_checkpoints()
+    assert act.completed_steps() == {}
+
+
 def test_decorator_just_func(gitrepo):
     @activity
     def collapse():
@@ -1,4 +1,8 @@
 """Tests the appimage activity."""
+import os
+import sys
+import stat
+
 from rever import vcsutils
 from rever.logger import current_logger
 from rever.main import env_main
@@ -62,7 +66,7 @@ Categories=System;
 Terminal=true
 """
 
-def test_appimage(gitrepo):
+def write_appimage_files():
     Path('appimage').mkdir(exist_ok=True)
     files = [('rever.xsh', REVER_XSH), ('setup.py', SETUP_FILE),
              ('appimage/entrypoint.sh', APPIMAGE_ENTRYPOINT_FILE),
@@ -74,5 +78,91 @@ def test_appimage(gitrepo):
             f.write(body)
     vcsutils.track('.')
     vcsutils.commit('Some versioned files')
+
+
+def test_appimage(gitrepo):
+    write_appimage_files()
     env_main(['42.1.1'])
     assert Path('xonsh-x86_64.AppImage') in Path('.').glob('*')
+
+
+FAKE_DOCKER = """#!{python}
+import os, sys
+args = sys.argv[1:]
+with open({calls!r}, 'a') as f:
+    f.write(' '.join(args) + '\\n')
+built = os.path.exists({calls!r} + '.built')
+if args[0] == 'images':
+    print('sha256:builder' if built else '')
+elif args[0] == 'build':
+    sys.stdin.read()
+    if 'broken' in {calls!r}:
+        sys.exit(1)
+    open({calls!r} + '.built', 'w').close()
+elif args[:2] == ['image', 'inspect']:
+    sys.exit(0 if built else 1)
+elif args[0] == 'run':
+    mounts = dict(reversed(args[i + 1].rsplit(':', 1))
+                  for i, a in enumerate(args) if a == '-v')
+    outdir = mounts[args[args.index('-w') + 1]]
+    open(os.path.join(outdir, 'xonsh-x86_64.AppImage'), 'w').close()
+"""
+
+
+def write_fake_docker(d, calls='docker-calls'):
+    bindir = os.path.join(d, 'bin')
+    os.makedirs(bindir)
+    calls = os.path.join(d, calls)
+    docker = os.path.join(bindir, 'docker')
+    with open(docker, 'w') as f:
+        f.write(FAKE_DOCKER.format(python=sys.executable, calls=calls))
+    os.chmod(docker, os.stat(docker).st_mode | stat.S_IEXEC)
+    with open('rever.xsh', 'a') as f:
+        f.write('$PATH.insert(0, {0!r})\n'.format(bindir))
+        f.write("$APPIMAGE_USE_DOCKER = True\n")
+        f.write("$APPIMAGE_PYTHON_VERSION = ['3.10', '3.11']\n")
+    return calls
+
+
+def test_appimage_builder_image(gitrepo):
+    write_appimage_files()
+    calls = write_fake_docker(gitrepo)
+    env_main(['42.1.1'])
+    for ver in ['3.10', '3.11']:
+        assert os.path.isfile('xonsh-x86_64-python' + ver + '.AppImage')
+    env_main(['-f', '42.1.2'])
+    with open(calls) as f:
+        cmds = f.read().splitlines()
+    # the builder image is only built once
+    builds = [c for c in cmds if c.startswith('build ')]
+    assert len(builds) == 1
+    assert builds[0].startswith('build -t rever/appimage-builder:1.2.5 ')
+    runs = [c for c in cmds if c.startswith('run ')]
+    assert len(runs) == 4
+    for ver in ['3.10', '3.11']:
+        assert any(c.endswith('rever/appimage-builder:1.2.5 python -m python_appimage '
+                              'build app --python-version ' + ver + ' /dir/appimage')
+                   for c in runs[2:])
+
+
+def test_appimage_failure_cleans_up(gitrepo):
+    write_appimage_files()
+    write_fake_docker(gitrepo, calls='broken-docker-calls')
+    try:
+        env_main(['42.1.1'])
+        assert False, 'the release should have failed'
+    except SystemExit:
+        pass
+    # the generated requirements are not left in the descriptor dir
+    assert not os.path.exists(os.path.join('appimage', 'requirements.txt'))
+
+
+def test_appimage_rever_dir_outside(gitrepo, tmpdir):
+    write_appimage_files()
+    write_fake_docker(gitrepo)
+    rever_dir = str(tmpdir.join('rever-dir'))
+    with open('rever.xsh', 'a') as f:
+        f.write('$REVER_DIR = {0!r}\n'.format(rever_dir))
+    env_main(['42.1.1'])
+    for ver in ['3.10', '3.11']:
+        assert os.path.isfile('xonsh-x86_64-python' + ver + '.AppImage')
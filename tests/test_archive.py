@@ -0,0 +1,73 @@
+"""Archive tests"""
+import io
+import os
+import gzip
+import lzma
+import random
+import tarfile
+import builtins
+import subprocess
+
+import pytest
+
+from rever.archive import ParallelGzipWriter, git_archive
+
+
+@pytest.mark.parametrize('size, blocksize', [
+    (0, 1 << 10),
+    (1000, 1 << 10),
+    (200000, 1 << 12),
+])
+def test_parallel_gzip(size, blocksize):
+    rand = random.Random(size)
+    words = [b'rever', b'release', b'archive', b'tarball', b'\n']
+    data = b' '.join(rand.choice(words) for i in range(size // 6))[:size]
+    f = io.BytesIO()
+    with ParallelGzipWriter(f, jobs=4, blocksize=blocksize) as writer:
+        for i in range(0, len(data), 1000):
+            writer.write(data[i:i + 1000])
+    assert gzip.decompress(f.getvalue()) == data
+    # priming each block with the previous one keeps the size close to zlib
+    if size > blocksize:
+        assert len(f.getvalue()) < 1.2 * len(gzip.compress(data))
+
+
+def test_git_archive(gitrepo):
+    with open('rever.xsh', 'w') as f:
+        f.write('$PROJECT = "sophia"\n')
+    subprocess.run(['git', 'add', 'rever.xsh'])
+    subprocess.run(['git', 'commit', '-m', 'add rc'])
+    subprocess.run(['git', 'tag', 'v42'])
+    env = builtins.__xonsh__.env
+    outdir = os.path.join(gitrepo, env['REVER_DIR'])
+    os.makedirs(outdir, exist_ok=True)
+    fnames = git_archive('v42', 'sophia-v42', formats=('tar.gz', 'tar.xz', 'tar'))
+    assert [os.path.basename(f) for f in fnames] == \
+        ['sophia-v42.tar.gz', 'sophia-v42.tar.xz', 'sophia-v42.tar']
+    exp = subprocess.run(['git', 'archive', '--format=tar', '--prefix=sophia-v42/', 'v42'],
+                         stdout=subprocess.PIPE, check=True).stdout
+    with open(fnames[0], 'rb') as f:
+        assert gzip.decompress(f.read()) == exp
+    with open(fnames[1], 'rb') as f:
+        assert lzma.decompress(f.read()) == exp
+    with tarfile.open(fnames[2]) as tar:
+        assert sorted(tar.getnames()) == \
+            ['sophia-v42', 'sophia-v42/README', 'sophia-v42/rever.xsh']
+    # the archives are reused, rather than made again
+    mtime = os.stat(fnames[0]).st_mtime_ns
+    again = git_archive('v42', 'sophia-v42', formats=('tar.gz',))
+    assert again == fnames[:1]
+    assert os.stat(again[0]).st_mtime_ns == mtime
+    with pytest.raises(ValueError):
+        git_archive('v42', 'sophia-v42', formats=('zip',))
+
+
+def test_git_archive_failure(gitrepo, monkeypatch):
+    env = builtins.__xonsh__.env
+    cachedir = os.path.join(gitrepo, env['REVER_DIR'], 'archives')
+    os.makedirs(cachedir)
+    # make git archive fail after the compressors have started
+    monkeypatch.setattr('rever.archive.commit_hash', lambda rev: 'x' * 40)
+    with pytest.raises(RuntimeError):
+        git_archive('no-such-tag', 'sophia', formats=('tar.gz', 'tar.xz'))
+    assert [files for _, _, files in os.walk(cachedir) if files] == []
@@ -0,0 +1,94 @@
+"""Tests the authorship utilities."""
+import os
+import copy
+
+import pytest
+from ruamel.yaml import YAML
+
+from rever.authors import AuthorIndex, load_metadata, update_metadata
+
+
+AUTHORS_YAML = """- name: Jane Doe
+  email: jane@example.com
+  aliases:
+  - jdoe
+  alternate_emails:
+  - jane@old.example.com
+  github: janedoe
+- name: John Smith
+  email: john@example.com
+"""
+
+
+def test_author_index():
+    md = [{'name': 'Jane Doe', 'email': 'jane@example.com', 'aliases': ['jdoe'],
+           'alternate_emails': ['jane@old.example.com'], 'github': 'janedoe'}]
+    index = AuthorIndex(md)
+    jane = md[0]
+    assert index.by_names == {'Jane Doe': jane, 'jdoe': jane}
+    assert index.by_emails == {'jane@example.com': jane, 'jane@old.example.com': jane}
+    assert index.by_githubs == {'janedoe': jane}
+    assert index.by_aliases['jane'] is jane
+    john = {'name': 'John Smith', 'email': 'john@example.com'}
+    index.add(john)
+    assert index.by_aliases['john smith'] is john
+    index.set_github(john, 'jsmith')
+    assert john['github'] == 'jsmith'
+    assert index.by_githubs['jsmith'] is john
+
+
+def test_load_metadata_cache(gitrepo, monkeypatch):
+    with open('authors.yaml', 'w') as f:
+        f.write(AUTHORS_YAML)
+    md = load_metadata('authors.yaml')
+
+    def fail(*args, **kwargs):
+        raise AssertionError('the metadata was parsed or copied again')
+
+    # the second load neither parses nor copies the metadata
+    with monkeypatch.context() as m:
+        m.setattr(YAML, 'load', fail)
+        m.setattr(copy, 'deepcopy', fail)
+        m.setattr(copy, 'copy', fail)
+        assert load_metadata('authors.yaml') is md
+        # writable metadata is taken out of the cache, rather than copied
+        writable = load_metadata('authors.yaml', writable=True)
+        assert writable is md
+    writable[0]['name'] = 'changed'
+    assert load_metadata('authors.yaml')[0]['name'] == 'Jane Doe'
+    # the metadata is reloaded when the file changes
+    with open('authors.yaml', 'w') as f:
+        f.write(AUTHORS_YAML.replace('Jane Doe', 'Jane Q. Doe'))
+    assert load_metadata('authors.yaml')[0]['name'] == 'Jane Q. Doe'
+
+
+def test_update_metadata_skips_write(gitrepo, monkeypatch):
+    update_metadata('authors.yaml')
+    mtime = os.stat('authors.yaml').st_mtime_ns
+    with open('authors.yaml') as f:
+        before = f.read()
+    # nothing has changed in the repo, so the file is not rewritten
+    md = update_metadata('authors.yaml')
+    assert os.stat('authors.yaml').st_mtime_ns == mtime
+    with open('authors.yaml') as f:
+        assert f.read() == before
+    # but the unchanged metadata is cached again
+    monkeypatch.setattr(YAML, 'load', lambda *args: pytest.fail('parsed again'))
+    assert load_metadata('authors.yaml') is md
+
+
+def test_update_metadata_reuses_index(gitrepo, monkeypatch):
+    with open('authors.yaml', 'w') as f:
+        f.write(AUTHORS_YAML)
+    md, yaml = load_metadata('authors.yaml', return_yaml=True, writable=True)
+    index = AuthorIndex(md)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('the metadata was loaded or validated again')
+
+    monkeypatch.setattr('rever.authors.load_metadata', fail)
+    monkeypatch.setattr('rever.authors.metadata_is_valid', fail)
+    y = update_metadata('authors.yaml', write=False, metadata=md, yaml=yaml,
+                        index=index)
+    assert y is md
+    assert all('num_commits' in x for x in y)
@@ -1,6 +1,8 @@
 """Tests the changelog activity."""
 import os
 
+import pytest
+
 from rever import vcsutils
 from rever.logger import current_logger
 from rever.main import env_main
@@ -356,3 +358,61 @@ def test_changelog_conda_build_style(gitrepo):
     assert entries[-2]['rev'] != entries[-1]['rev']
 
 
+def test_news_preview(gitrepo, capsys):
+    os.makedirs('nuws', exist_ok=True)
+    files = [('rever.xsh', REVER_XSH),
+             ('nuws/TEMPLATE.rst', TEMPLATE_RST),
+             ('nuws/n0.rst', N0_RST),
+             ('nuws/n1.rst', N1_RST),
+             ]
+    for filename, body in files:
+        with open(filename, 'w') as f:
+            f.write(body)
+    env_main(['news', '--preview'])
+    out = capsys.readouterr().out
+    assert out == CHANGELOG_42_1_1.split('\n\n\n\n')[0].replace('42.1.1', 'x.y.z') + '\n\n\n'
+    # nothing was removed
+    assert sorted(os.listdir('nuws')) == ['TEMPLATE.rst', 'n0.rst', 'n1.rst']
+
+
+def test_news_malformed(gitrepo, capsys):
+    os.makedirs('nuws', exist_ok=True)
+    files = [('rever.xsh', REVER_XSH),
+             ('nuws/n0.rst', N0_RST),
+             ('nuws/n1.rst', 'oops\n\n' + N1_RST),
+             ('nuws/n2.rst', '* no category\n'),
+             ]
+    for filename, body in files:
+        with open(filename, 'w') as f:
+            f.write(body)
+    with pytest.raises(SystemExit):
+        env_main(['news'])
+    err = capsys.readouterr().err
+    assert 'n0.rst' not in err
+    assert 'nuws/n1.rst' in err and 'text before the first category' in err
+    assert 'nuws/n2.rst' in err and 'no categories found' in err
+    assert len(os.listdir('nuws')) == 3
+
+
+def test_changelog_malformed(gitrepo, capsys):
+    os.makedirs('nuws', exist_ok=True)
+    files = [('rever.xsh', REVER_XSH),
+             ('CHANGELOG.rst', CHANGELOG_RST),
+             ('nuws/TEMPLATE.rst', TEMPLATE_RST),
+             ('nuws/n0.rst', 'oops\n\n' + N0_RST),
+             ('nuws/n1.rst', N1_RST),
+             ('nuws/n2.rst', '* no category\n'),
+             ]
+    for filename, body in files:
+        with open(filename, 'w') as f:
+            f.write(body)
+    vcsutils.track('.')
+    vcsutils.commit('initial changelog and news')
+    # the release still works, as before, but warns about the malformed files
+    env_main(['42.1.1'])
+    err = capsys.readouterr().err
+    assert 'nuws/n0.rst: text before the first category' in err
+    assert 'nuws/n2.rst: no categories found' in err
+    assert os.listdir('nuws') == ['TEMPLATE.rst']
+    with open('CHANGELOG.rst') as f:
+        assert f.read() == CHANGELOG_42_1_1
@@ -1,5 +1,8 @@
 """DAG tests"""
-from rever.dag import find_path
+import pytest
+
+from rever.dag import (find_path, critical_path_order, compile_dag, CompiledDAG,
+    DAGCycleError)
 from rever.activity import Activity
 
 
@@ -124,3 +127,70 @@ def test_five_forked_done():
     path, already_done = find_path(dag, {'b', 'c', 'd', 'e'}, done={'a', 'c'})
     assert ['b', 'd', 'e'] == path
     assert ['c', 'a'] == already_done
+
+
+def test_critical_path_order():
+    dag = {'a': Activity(), 'b': Activity(), 'c': Activity(deps={'b'}),
+           'd': Activity(deps={'a', 'c'}), 'e': Activity()}
+    durations = {'a': 1.0, 'b': 2.0, 'c': 5.0, 'd': 1.0, 'e': 4.0}
+    order, levels, critical_path = critical_path_order(dag, list('abcde'), durations)
+    assert levels == {'a': 2.0, 'b': 8.0, 'c': 6.0, 'd': 1.0, 'e': 4.0}
+    assert order == ['b', 'c', 'e', 'a', 'd']
+    assert critical_path == ['b', 'c', 'd']
+    # unknown durations and deps that are not run
+    order, levels, critical_path = critical_path_order(dag, list('acd'), {})
+    assert order == ['a', 'c', 'd']
+    assert critical_path == ['a', 'd']
+
+
+def test_critical_path_order_cycle():
+    dag = {'a': Activity(deps={'b'}), 'b': Activity(deps={'a'}), 'c': Activity()}
+    with pytest.raises(DAGCycleError) as e:
+        critical_path_order(dag, list('abc'), {})
+    assert e.value.cycle == ['a', 'b', 'a']
+
+
+def test_cycle():
+    dag = {'a': Activity(deps={'c'}), 'b': Activity(deps={'a'}),
+           'c': Activity(deps={'b'}), 'd': Activity(deps={'c'})}
+    with pytest.raises(DAGCycleError) as e:
+        find_path(dag, {'d'})
+    assert e.value.cycle == ['a', 'b', 'c', 'a']
+    assert 'a -> b -> c -> a' in str(e.value)
+
+
+def test_long_chain():
+    n = 5000
+    dag = {str(i): Activity(deps={str(i - 1)} if i else set()) for i in range(n)}
+    path, _ = find_path(dag, {str(n - 1)})
+    assert path == [str(i) for i in range(n)]
+    compiled = CompiledDAG(dag, {str(n - 1)})
+    assert compiled.index[str(n - 1)] == n - 1
+
+
+def test_missing():
+    dag = {'a': Activity(deps={'x'}), 'b': Activity()}
+    with pytest.raises(KeyError, match="'x' not found in DAG!"):
+        find_path(dag, {'a'})
+    # missing activities are fine if they are not needed
+    path, already_done = find_path(dag, {'a'}, done={'a'})
+    assert path == []
+    assert already_done == ['a']
+
+
+def test_compile_dag_cache(tmpdir):
+    rc = str(tmpdir.join('rever.xsh'))
+    with open(rc, 'w') as f:
+        f.write('$ACTIVITIES = ["b"]\n')
+    dag = {'a': Activity(), 'b': Activity(deps={'a'})}
+    compiled = compile_dag(dag, {'b'}, rc=rc)
+    assert compile_dag(dag, {'b'}, rc=rc) is compiled
+    assert compile_dag(dag, {'a'}, rc=rc) is not compiled
+    # changing the DAG recompiles it
+    dag['a'] = Activity()
+    recompiled = compile_dag(dag, {'b'}, rc=rc)
+    assert recompiled is not compiled
+    # as does changing the rc file
+    with open(rc, 'a') as f:
+        f.write('# changed\n')
+    assert compile_dag(dag, {'b'}, rc=rc) is not recompiled
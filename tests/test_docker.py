@@ -1,5 +1,7 @@
 """Docker Tests"""
 import os
+import time
+import tarfile
 import builtins
 import tempfile
 
@@ -8,7 +10,7 @@ import pytest
 from rever import environ
 from rever.docker import (apt_deps, conda_deps, pip_deps, make_base_dockerfile,
     docker_envvars, make_install_dockerfile, docker_source_from, git_configure, validate_mount,
-    mount_argument)
+    mount_argument, parse_image_ref, dockerfile_sources, context_tarball)
 
 
 @pytest.fixture
@@ -270,3 +272,69 @@ def test_validate_mount(mount, exp):
 def test_mount_argument(mount, exp):
     obs = mount_argument(mount)
     assert exp == obs
+
+
+@pytest.mark.parametrize('ref, exp', [
+    ('ubuntu', ('registry-1.docker.io', 'library/ubuntu', 'latest')),
+    ('regro/rever:1.0', ('registry-1.docker.io', 'regro/rever', '1.0')),
+    ('localhost:5000/rever', ('localhost:5000', 'rever', 'latest')),
+    ('gcr.io/org/app:v2@sha256:abc', ('gcr.io', 'org/app', 'v2')),
+])
+def test_parse_image_ref(ref, exp):
+    assert exp == parse_image_ref(ref)
+
+
+@pytest.mark.parametrize('text, exp', [
+    ('FROM debian\nCOPY a.txt b/ /dst/\n', ['a.txt', 'b']),
+    ('FROM debian\nADD --chown=1:1 ["src/*.py", "/dst/"]\n', ['src/*.py']),
+    ('FROM debian\nCOPY --from=build /out /out\nADD https://x.org/f /f\n', []),
+    ('FROM debian\nCOPY setup.py \\\n    ./pkg /src/\n', ['pkg', 'setup.py']),
+    ('FROM debian\nRUN --mount=type=bind,source=reqs.txt,target=/r pip\n', ['reqs.txt']),
+    ('FROM debian\nCOPY $SRC /src\n', ['.']),
+    ('FROM debian\nCOPY . /src\n', ['.']),
+])
+def test_dockerfile_sources(text, exp):
+    assert exp == dockerfile_sources(text)
+
+
+def test_context_tarball(dockerenv):
+    with tempfile.TemporaryDirectory() as d:
+        dockerenv['REVER_DIR'] = os.path.join(d, 'rever')
+        dockerenv['REVER_CACHE_DIR'] = os.path.join(d, 'rever', 'cache')
+        files = {'Dockerfile': 'FROM debian\nCOPY src setup.py /app/\n',
+                 '.dockerignore': '**/*.pyc\n!src/keep.pyc\n',
+                 'setup.py': 'setup()', 'src/mod.py': 'x = 1', 'src/mod.pyc': '',
+                 'src/keep.pyc': '', 'dist/big.whl': 'big', 'rever/cache/x': ''}
+        for fname, body in files.items():
+            path = os.path.join(d, fname)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(body)
+        dockerfile = os.path.join(d, 'Dockerfile')
+        tarball, arcname = context_tarball(dockerfile, d)
+        assert arcname == 'Dockerfile'
+        with tarfile.open(tarball) as tar:
+            names = tar.getnames()
+            assert {m.mtime for m in tar.getmembers()} == {0}
+        assert names == ['Dockerfile', 'setup.py', 'src/keep.pyc', 'src/mod.py']
+        # unchanged contexts are reused, and touched files give the same tarball
+        assert context_tarball(dockerfile, d)[0] == tarball
+        os.utime(os.path.join(d, 'setup.py'), (time.time() + 10, time.time() + 10))
+        assert context_tarball(dockerfile, d)[0] == tarball
+        with open(os.path.join(d, 'setup.py'), 'w') as f:
+            f.write('setup(name="x")')
+        new = context_tarball(dockerfile, d)[0]
+        assert new != tarball
+        assert os.path.isfile(new)
+        # tarballs dropped from the index are only removed once they have
+        # not been used since the process started
+        with open(os.path.join(d, 'setup.py'), 'w') as f:
+            f.write('setup(name="y")')
+        newer = context_tarball(dockerfile, d, keep=1)[0]
+        assert os.path.isfile(tarball) and os.path.isfile(new)
+        os.utime(tarball, (0, 0))
+        with open(os.path.join(d, 'setup.py'), 'w') as f:
+            f.write('setup(name="z")')
+        context_tarball(dockerfile, d, keep=1)
+        assert not os.path.exists(tarball)
+        assert os.path.isfile(new) and os.path.isfile(newer)
@@ -0,0 +1,218 @@
+"""Tests the docker activities."""
+import os
+import stat
+import json
+import builtins
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from rever.logger import current_logger
+from rever.main import env_main
+
+
+FAKE_DOCKER = """#!/bin/sh
+if [ "$1 $2" = "image inspect" ]; then
+    echo "sha256:aaaa"
+    exit 0
+fi
+echo "$@" >> {calls}
+case "$*" in
+    *broken*) echo "build failed" ; exit 1 ;;
+esac
+echo "built"
+"""
+
+REVER_XSH = """
+$ACTIVITIES = ['docker_build']
+$PROJECT = 'rever'
+$PATH.insert(0, {bindir!r})
+$DOCKERFILE = 'Dockerfile'
+$DOCKER_BUILD_ARGS = {{'BASE': 'debian'}}
+$DOCKER_BUILD_MINIMAL_CONTEXT = True
+$DOCKER_BUILD_BUILDS = [
+    {{'tags': ['rever:$VERSION-py' + py], 'build_args': {{'PYTHON': py}}}}
+    for py in ['3.10', '3.11', '3.12']
+] + [{{'name': 'slim', 'path': 'slim.dockerfile', 'tags': ['rever:slim']}}]
+"""
+
+
+def rever_dir():
+    return builtins.__xonsh__.env['REVER_DIR']
+
+
+def write_fake_docker(d):
+    bindir = os.path.join(d, 'bin')
+    os.makedirs(bindir, exist_ok=True)
+    calls = os.path.join(d, 'docker-calls')
+    docker = os.path.join(bindir, 'docker')
+    with open(docker, 'w') as f:
+        f.write(FAKE_DOCKER.format(calls=calls))
+    os.chmod(docker, os.stat(docker).st_mode | stat.S_IEXEC)
+    return bindir, calls
+
+
+DOCKERFILE = """FROM python:$PYTHON
+COPY setup.py /src/
+"""
+
+
+def write_dockerfiles():
+    for fname in ['Dockerfile', 'slim.dockerfile', 'broken.dockerfile']:
+        with open(fname, 'w') as f:
+            f.write(DOCKERFILE)
+    with open('setup.py', 'w') as f:
+        f.write('# setup\n')
+
+
+def test_docker_build_matrix(gitrepo):
+    bindir, calls = write_fake_docker(gitrepo)
+    write_dockerfiles()
+    with open('rever.xsh', 'w') as f:
+        f.write(REVER_XSH.format(bindir=bindir))
+    env_main(['1.0'])
+    with open(calls) as f:
+        builds = f.read().splitlines()
+    assert len(builds) == 4
+    # the first build of each Dockerfile is built fresh, and the others
+    # reuse its layers
+    first = [b for b in builds if 'rever:1.0-py3.10' in b][0]
+    assert '--no-cache' in first
+    assert '--build-arg BASE=debian --build-arg PYTHON=3.10' in first
+    # a minimal context is sent on stdin
+    assert first.startswith('build -f Dockerfile ')
+    assert first.endswith(' -')
+    for py in ['3.11', '3.12']:
+        b = [b for b in builds if 'rever:1.0-py' + py in b][0]
+        assert '--no-cache' not in b
+        assert '--cache-from rever:1.0-py3.10' in b
+    slim = [b for b in builds if 'rever:slim' in b][0]
+    assert slim.startswith('build -f slim.dockerfile')
+    assert '--no-cache' in slim
+    assert os.path.isfile(os.path.join(rever_dir(), 'docker-build', 'slim.log'))
+    entries = [e for e in current_logger().load() if e['category'] == 'docker-build']
+    assert set(entries[-1]['data']) == {'rever:1.0-py3.10', 'rever:1.0-py3.11',
+                                        'rever:1.0-py3.12', 'slim'}
+
+
+def test_docker_build_matrix_failure(gitrepo):
+    bindir, calls = write_fake_docker(gitrepo)
+    write_dockerfiles()
+    with open('rever.xsh', 'w') as f:
+        f.write(REVER_XSH.format(bindir=bindir).replace("'slim.dockerfile'",
+                                                         "'broken.dockerfile'"))
+    try:
+        env_main(['1.0'])
+        assert False, 'the release should have failed'
+    except SystemExit:
+        pass
+    with open(calls) as f:
+        assert len(f.read().splitlines()) == 4
+    entries = current_logger().load()
+    error = [e for e in entries if e['category'] == 'activity-error'][-1]
+    assert 'docker builds failed: slim' in error['message']
+    with open(os.path.join(rever_dir(), 'docker-build', 'slim.log')) as f:
+        assert f.read() == 'build failed\n'
+
+
+SINGLE_XSH = """
+$ACTIVITIES = ['docker_build']
+$PROJECT = 'rever'
+$PATH.insert(0, {bindir!r})
+$DOCKERFILE = 'app.dockerfile'
+$DOCKERFILE_CONTEXT = 'docker'
+$DOCKERFILE_TAGS = ['rever:$VERSION']
+"""
+
+
+def test_docker_build_single_context(gitrepo):
+    bindir, calls = write_fake_docker(gitrepo)
+    os.makedirs('docker')
+    with open(os.path.join('docker', 'app.dockerfile'), 'w') as f:
+        f.write(DOCKERFILE)
+    with open('rever.xsh', 'w') as f:
+        f.write(SINGLE_XSH.format(bindir=bindir))
+    env_main(['1.0'])
+    with open(calls) as f:
+        builds = f.read().splitlines()
+    # the Dockerfile is found relative to the context, as before
+    assert len(builds) == 1
+    assert builds[0].startswith('build -f ' + os.path.join('docker', 'app.dockerfile') +
+                                ' -t rever:1.0 ')
+    assert builds[0].endswith(' docker')
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """A stand-in for a registry with token auth, which has the local image
+    under the tag 1.0 and a different image under the tag old.
+    """
+
+    configs = {'1.0': 'sha256:aaaa', 'old': 'sha256:bbbb'}
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/token?'):
+            assert 'scope=repository%3Arever%3Apull' in self.path
+            self.send_json(200, {'token': 'xyz'})
+            return
+        if self.headers.get('Authorization', None) != 'Bearer xyz':
+            realm = 'http://127.0.0.1:{0}/token'.format(self.server.server_port)
+            challenge = 'Bearer realm="{0}",service="registry"'.format(realm)
+            self.send_json(401, {}, [('WWW-Authenticate', challenge)])
+            return
+        tag = self.path.rpartition('/')[2]
+        if tag not in self.configs:
+            self.send_json(404, {'errors': [{'code': 'MANIFEST_UNKNOWN'}]})
+            return
+        manifest = {'schemaVersion': 2, 'config': {'digest': self.configs[tag]}}
+        self.send_json(200, manifest, [('Docker-Content-Digest', 'sha256:' + tag)])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def registry():
+    server = HTTPServer(('127.0.0.1', 0), RegistryHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+PUSH_REVER_XSH = """
+$ACTIVITIES = ['docker_push']
+$PROJECT = 'rever'
+$PATH.insert(0, {bindir!r})
+$DOCKERFILE_TAGS = ['{registry}/rever:1.0', '{registry}/rever:old',
+                    '{registry}/rever:latest']
+"""
+
+
+def test_docker_push_skips_published(gitrepo, registry):
+    bindir, calls = write_fake_docker(gitrepo)
+    host = '127.0.0.1:{0}'.format(registry.server_port)
+    with open('rever.xsh', 'w') as f:
+        f.write(PUSH_REVER_XSH.format(bindir=bindir, registry=host))
+    env_main(['1.0'])
+    with open(calls) as f:
+        pushes = sorted(f.read().splitlines())
+    assert pushes == ['push ' + host + '/rever:latest', 'push ' + host + '/rever:old']
+    entries = [e for e in current_logger().load() if e['category'] == 'docker-push']
+    data = entries[-1]['data']
+    assert data[host + '/rever:1.0']['status'] == 'skipped'
+    assert data[host + '/rever:old']['status'] == 'pushed'
+    assert data[host + '/rever:latest']['status'] == 'pushed'
@@ -1,5 +1,13 @@
+import os
+import stat
+import sys
+import builtins
+
+import pytest
+
 from rever.logger import current_logger
 from rever.main import env_main
+from rever.activities.gcloud import DeploytoGCloud, cluster_target, rollout_status
 
 GCLOUD_REVER_XSH = """
 $ACTIVITIES = ['deploy_to_gcloud']
@@ -21,6 +29,69 @@ $GCLOUD_ZONE = 'us-central1-a'
 """
 
 
+FAKE_GCLOUD = """#!{python}
+import os, sys
+args = sys.argv[1:]
+if args[:3] == ['config', 'get-value', 'account']:
+    print('me@example.com')
+elif args[:3] == ['container', 'clusters', 'get-credentials']:
+    with open({calls!r}, 'a') as f:
+        f.write('get-credentials ' + args[-1] + '\\n')
+    with open(os.environ['KUBECONFIG'], 'w') as f:
+        f.write('fresh ' + args[-1])
+"""
+
+
+FAKE_KUBECTL = """#!{python}
+import os, sys, json
+args = sys.argv[1:]
+kubeconfig, context = args[1], args[3]
+args = args[4:]
+with open(kubeconfig) as f:
+    if f.read() != 'fresh ' + context.rsplit('_', 1)[1]:
+        print('error: the server has asked for the client to provide credentials')
+        sys.exit(1)
+with open({calls!r}, 'a') as f:
+    f.write(context + ' ' + ' '.join(args) + '\\n')
+if args[0] != 'get':
+    sys.exit(0)
+# each cluster becomes healthy one replica per poll, except the broken
+# ones, which never progress
+polls = os.path.join(os.path.dirname({calls!r}), context + '.polls')
+n = int(open(polls).read()) + 1 if os.path.exists(polls) else 1
+with open(polls, 'w') as f:
+    f.write(str(n))
+if 'garbled' in context:
+    print('{{"metadata": {{"name": "app"')
+    sys.exit(0)
+status = {{'observedGeneration': 2, 'replicas': 2, 'updatedReplicas': min(n, 2),
+          'availableReplicas': min(n, 2)}}
+if 'broken' in context:
+    status['updatedReplicas'] = status['availableReplicas'] = 0
+    if 'deadline' in context:
+        status['conditions'] = [{{'type': 'Progressing',
+                                  'reason': 'ProgressDeadlineExceeded'}}]
+print(json.dumps({{'metadata': {{'name': 'app', 'generation': 2}},
+                  'spec': {{'replicas': 2}}, 'status': status}}))
+"""
+
+
+def rever_dir():
+    return builtins.__xonsh__.env['REVER_DIR']
+
+
+def write_fakes(d):
+    bindir = os.path.join(d, 'bin')
+    os.makedirs(bindir, exist_ok=True)
+    calls = os.path.join(d, 'calls')
+    for name, body in [('gcloud', FAKE_GCLOUD), ('kubectl', FAKE_KUBECTL)]:
+        fname = os.path.join(bindir, name)
+        with open(fname, 'w') as f:
+            f.write(body.format(python=sys.executable, calls=calls))
+        os.chmod(fname, os.stat(fname).st_mode | stat.S_IEXEC)
+    return bindir, calls
+
+
 def test_deploy_to_gcloud(gitrepo, gcloudecho, kubectlecho):
     files = [('rever.xsh', GCLOUD_REVER_XSH),
              ]
@@ -30,6 +101,113 @@ def test_deploy_to_gcloud(gitrepo, gcloudecho, kubectlecho):
     env_main(['0.1.0'])
 
 
+MULTI_REVER_XSH = GCLOUD_REVER_XSH + """
+$PATH.insert(0, {bindir!r})
+$GCLOUD_CONTAINER_NAME = 'app'
+$GCLOUD_CLUSTERS = ['east', 'europe-west1-b/west', 'other-project/asia-east1-a/{last}']
+$DEPLOY_TO_GCLOUD_POLL_INTERVAL = 0.01
+$DEPLOY_TO_GCLOUD_TIMEOUT = {timeout}
+"""
+
+
+def test_deploy_to_gcloud_clusters(gitrepo):
+    bindir, calls = write_fakes(gitrepo)
+    with open('rever.xsh', 'w') as f:
+        f.write(MULTI_REVER_XSH.format(bindir=bindir, last='north', timeout=10))
+    # a stale cached credential is refreshed
+    stale = cluster_target('east', project_id='hello-world', zone='us-central1-a')
+    os.makedirs(os.path.dirname(stale['kubeconfig']), exist_ok=True)
+    with open(stale['kubeconfig'], 'w') as f:
+        f.write('stale')
+    env_main(['0.1.0'])
+    # each cluster got its own credentials, and the environment is unchanged
+    for spec in ['east', 'europe-west1-b/west', 'other-project/asia-east1-a/north']:
+        t = cluster_target(spec, project_id='hello-world', zone='us-central1-a')
+        with open(t['kubeconfig']) as f:
+            assert f.read() == 'fresh ' + t['cluster']
+    assert 'KUBECONFIG' not in builtins.__xonsh__.env.detype()
+    with open(calls) as f:
+        lines = f.read().splitlines()
+    assert sorted(l for l in lines if l.startswith('get-credentials')) == \
+        ['get-credentials east', 'get-credentials north', 'get-credentials west']
+    image = 'app=docker.io/hello-world-org/hello-world-repo:0.1.0'
+    for context in ['gke_hello-world_us-central1-a_east',
+                    'gke_hello-world_europe-west1-b_west',
+                    'gke_other-project_asia-east1-a_north']:
+        assert context + ' set image deployment/app ' + image in lines
+        assert lines.count(context + ' get deployment/app -o json') == 2
+    assert os.path.isfile(os.path.join(rever_dir(), 'gcloud-rollout',
+                                       'europe-west1-b_west.log'))
+    entries = [e for e in current_logger().load() if e['category'] == 'gcloud-rollout']
+    data = entries[-1]['data']
+    assert {name: d['status'] for name, d in data.items()} == \
+        {'us-central1-a/east': 'done', 'europe-west1-b/west': 'done',
+         'asia-east1-a/north': 'done'}
+    # the credentials are cached for the next run
+    with open(calls, 'w'):
+        pass
+    env_main(['0.1.1'])
+    with open(calls) as f:
+        assert not [l for l in f if l.startswith('get-credentials')]
+
+
+@pytest.mark.parametrize('last, timeout, exp', [
+    ('broken', 2, 'timeout'),
+    ('broken-deadline', 10, 'failed'),
+    ('garbled', 10, 'failed'),
+])
+def test_deploy_to_gcloud_clusters_failure(gitrepo, last, timeout, exp):
+    bindir, calls = write_fakes(gitrepo)
+    with open('rever.xsh', 'w') as f:
+        f.write(MULTI_REVER_XSH.format(bindir=bindir, last=last, timeout=timeout))
+    try:
+        env_main(['0.1.0'])
+        assert False, 'the release should have failed'
+    except SystemExit:
+        pass
+    entries = current_logger().load()
+    data = [e for e in entries if e['category'] == 'gcloud-rollout'][-1]['data']
+    assert data['us-central1-a/east']['status'] == 'done'
+    assert data['asia-east1-a/' + last]['status'] == exp
+    error = [e for e in entries if e['category'] == 'activity-error'][-1]
+    assert 'failed to rollout the new image to asia-east1-a/' + last in error['message']
+
+
+def test_kubectl_env(gitrepo, monkeypatch):
+    bindir, calls = write_fakes(gitrepo)
+    env = builtins.__xonsh__.env
+    monkeypatch.setitem(env, 'PATH', [bindir] + list(env['PATH']))
+    t = cluster_target('east', project_id='hello-world', zone='us-central1-a')
+    proc = DeploytoGCloud()._kubectl(t, ['version'], None, 'me@example.com')
+    assert proc.returncode == 0
+    with open(t['kubeconfig']) as f:
+        assert f.read() == 'fresh east'
+    # the kubeconfig is not set in the environment shared by the other clusters
+    assert 'KUBECONFIG' not in env.detype()
+
+
+def test_cluster_target(gitrepo):
+    t = cluster_target('proj/zone-a/c1', project_id='p', zone='z')
+    assert (t['project_id'], t['zone'], t['cluster']) == ('proj', 'zone-a', 'c1')
+    assert t['context'] == 'gke_proj_zone-a_c1'
+    t = cluster_target('c2', project_id='p', zone='z')
+    assert t['name'] == 'z/c2'
+    with pytest.raises(ValueError):
+        cluster_target('a/b/c/d')
+
+
+def test_rollout_status():
+    dep = {'metadata': {'name': 'app', 'generation': 3},
+           'spec': {'replicas': 2},
+           'status': {'observedGeneration': 2}}
+    assert rollout_status(dep)[0] == 'waiting'
+    dep['status'] = {'observedGeneration': 3, 'replicas': 3, 'updatedReplicas': 2,
+                     'availableReplicas': 2}
+    assert rollout_status(dep) == ('waiting', '1 old replicas are pending termination')
+    dep['status']['replicas'] = 2
+    assert rollout_status(dep)[0] == 'done'
+
+
 def test_deploy_to_gcloud_app(gitrepo, gcloudecho):
     files = [('rever.xsh', GCLOUD_APP_REVER_XSH),
              ]
@@ -0,0 +1,51 @@
+"""Tests the GitHub release activity."""
+import os
+import builtins
+
+from rever import github
+from rever.activities.ghrelease import GHRelease
+
+
+class FakeRelease:
+
+    def __init__(self):
+        self.uploads = []
+
+    def upload_asset(self, content_type, name, asset, label=None):
+        self.uploads.append((name, asset))
+
+
+class FakeRepo:
+    default_branch = 'master'
+
+
+class FakeGitHub:
+
+    def repository(self, org, repo):
+        return FakeRepo()
+
+
+def test_ghrelease_same_basename(gitrepo, monkeypatch):
+    env = builtins.__xonsh__.env
+    env['VERSION'] = '42.1'
+    env['GITHUB_ORG'] = 'regro'
+    env['GITHUB_REPO'] = 'rever'
+    rel = FakeRelease()
+    monkeypatch.setattr(github, 'login', lambda: FakeGitHub())
+    monkeypatch.setattr(github, 'create_or_get_release',
+                        lambda *args, **kwargs: rel)
+    for d in ('linux', 'osx'):
+        os.makedirs(d)
+        with open(os.path.join(d, 'pkg-42.1.tar.gz'), 'wb') as f:
+            f.write(d.encode())
+    assets = ['linux/pkg-$VERSION.tar.gz', 'osx/pkg-$VERSION.tar.gz']
+    act = GHRelease()
+    act._func(notes='', assets=assets)
+    # assets in different directories are separate steps
+    assert rel.uploads == [('pkg-42.1.tar.gz', b'linux'),
+                           ('pkg-42.1.tar.gz', b'osx')]
+    assert set(act.completed_steps()) == {'upload linux/pkg-42.1.tar.gz',
+                                          'upload osx/pkg-42.1.tar.gz'}
+    # both are skipped when trying again
+    act._func(notes='', assets=assets)
+    assert len(rel.uploads) == 2
@@ -1,20 +1,33 @@
 """Github Tests"""
 import os
+import re
+import json
+import socket
 import builtins
 import tempfile
+import time
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
 
 import pytest
 
 from rever import environ
-from rever.github import credfilename, read_credfile, credfile_new_format
+from rever.logger import Logger
+import requests
+
+from rever.github import (credfilename, read_credfile, credfile_new_format,
+    commit_logins, ETagCacheAdapter, GitHubAdapter, RateLimiter, session)
 
 
 @pytest.fixture
-def githubenv(request):
+def githubenv(request, tmp_path):
     with environ.context():
         env = builtins.__xonsh__.env
         env['GITHUB_ORG'] = 'wakka'
         env['GITHUB_REPO'] = 'jawaka'
+        # keep logs, such as those of rate limit waits, out of the source tree
+        env['REVER_DIR'] = str(tmp_path)
+        env['LOGGER'] = Logger(str(tmp_path / 'rever.log'))
         yield env
 
 
@@ -38,3 +51,251 @@ def test_read_credfile(githubenv):
     assert username == 'zappa'
     assert token == '45463104f006ccb3a512fb20e31b9a50f10ba38b'
     assert new_format
+
+
+# maps commit SHAs to the logins of their authors, for the GraphQL server
+LOGINS = {'a' * 40: 'zappa', 'b' * 40: None, 'c' * 40: 'beefheart',
+          'd' * 40: 'zappa', 'e' * 40: 'jawaka'}
+
+
+class GraphQLHandler(BaseHTTPRequestHandler):
+    """A stand-in for the GitHub GraphQL API, that knows about the commits in
+    LOGINS.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(body['query'])
+        assert self.headers['Authorization'] == 'bearer xyz'
+        repo = {}
+        for alias, sha in re.findall(r'(c\d+): object\(oid: "(\w+)"\)', body['query']):
+            if sha not in LOGINS:
+                repo[alias] = None
+            elif LOGINS[sha] is None:
+                repo[alias] = {'author': {'user': None}}
+            else:
+                repo[alias] = {'author': {'user': {'login': LOGINS[sha]}}}
+        out = json.dumps({'data': {'repository': repo}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    """Runs a local HTTP server in a thread, yields the server."""
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def graphql():
+    yield from serve(GraphQLHandler)
+
+
+def test_commit_logins(githubenv, graphql):
+    url = 'http://127.0.0.1:{0}/graphql'.format(graphql.server_port)
+    with tempfile.TemporaryDirectory() as d:
+        cache = os.path.join(d, 'logins.json')
+        shas = ['a' * 40, 'b' * 40, 'c' * 40, 'd' * 40, 'f' * 40]
+        logins = commit_logins(shas, token='xyz', url=url, cache=cache,
+                               batch_size=2)
+        assert logins == {'a' * 40: 'zappa', 'b' * 40: None,
+                          'c' * 40: 'beefheart', 'd' * 40: 'zappa'}
+        assert len(graphql.requests) == 3
+        assert '"wakka"' in graphql.requests[0]
+        # the second time, only the new and unknown commits are queried
+        shas.append('e' * 40)
+        logins = commit_logins(shas, token='xyz', url=url, cache=cache,
+                               batch_size=2)
+        assert logins['e' * 40] == 'jawaka'
+        assert len(graphql.requests) == 4
+        assert re.findall(r'oid: "(\w+)"', graphql.requests[-1]) == ['e' * 40, 'f' * 40]
+
+
+def test_commit_logins_bad_sha(githubenv):
+    with pytest.raises(ValueError):
+        commit_logins(['" } evil'], token='xyz', url='http://127.0.0.1:1',
+                      cache=False)
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    """Serves a repo whose description may be changed, with ETags."""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        body = json.dumps({'description': self.server.description}).encode()
+        etag = '"' + str(hash(body)) + '"'
+        if self.headers.get('If-None-Match', None) == etag:
+            self.send_response(304)
+            self.send_header('X-RateLimit-Remaining', '4999')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('X-RateLimit-Remaining', '4998')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def etagserver():
+    for server in serve(ETagHandler):
+        server.description = 'wakka'
+        yield server
+
+
+def test_etag_cache(etagserver):
+    url = 'http://127.0.0.1:{0}/repos/wakka/jawaka'.format(etagserver.server_port)
+    with tempfile.TemporaryDirectory() as d:
+        s = requests.Session()
+        s.mount('http://', ETagCacheAdapter(cache_dir=d))
+        r = s.get(url)
+        assert r.json() == {'description': 'wakka'}
+        assert not getattr(r, 'from_cache', False)
+        # the second request is answered from the cache
+        r = s.get(url)
+        assert 'If-None-Match' in etagserver.requests[-1]
+        assert r.status_code == 200
+        assert r.from_cache
+        assert r.json() == {'description': 'wakka'}
+        assert r.headers['X-RateLimit-Remaining'] == '4999'
+        # changes are picked up
+        etagserver.description = 'jawaka'
+        r = s.get(url)
+        assert r.json() == {'description': 'jawaka'}
+        assert not getattr(r, 'from_cache', False)
+        assert len(etagserver.requests) == 3
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails with a server error, then with a secondary rate limit, then
+    succeeds.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        n = len(self.server.requests)
+        if n == 1:
+            self.send_response(502)
+            body = b'{"message": "Server Error"}'
+        elif n == 2:
+            self.send_response(403)
+            self.send_header('Retry-After', '7')
+            body = b'{"message": "You have exceeded a secondary rate limit."}'
+        else:
+            self.send_response(200)
+            body = b'{"description": "wakka"}'
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Limit', '5000')
+        self.send_header('X-RateLimit-Remaining', str(5000 - n))
+        self.send_header('X-RateLimit-Reset', '2000000000')
+        self.send_header('X-RateLimit-Resource', 'core')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flakyserver(githubenv):
+    yield from serve(FlakyHandler)
+
+
+def test_rate_limit_retry(githubenv, flakyserver):
+    url = 'http://127.0.0.1:{0}/repos/wakka/jawaka'.format(flakyserver.server_port)
+    waits = []
+    limiter = RateLimiter(backoff=0.5, sleep=waits.append)
+    with tempfile.TemporaryDirectory() as d:
+        s = requests.Session()
+        s.mount('http://', GitHubAdapter(cache_dir=d, limiter=limiter))
+        r = s.get(url)
+    assert r.status_code == 200
+    assert r.json() == {'description': 'wakka'}
+    assert len(flakyserver.requests) == 3
+    assert len(waits) == 2
+    assert 0.0 <= waits[0] <= 0.5
+    assert waits[1] == 7.0
+    assert limiter.requests == 3
+    assert limiter.status() == {'core': {'limit': 5000, 'remaining': 4997,
+                                         'reset': 2000000000}}
+    entries = githubenv['LOGGER'].load()
+    assert [e['category'] for e in entries] == ['github-rate-limit'] * 2
+
+
+def test_rate_limit_post(githubenv, flakyserver):
+    url = 'http://127.0.0.1:{0}/repos/wakka/jawaka/releases'.format(
+        flakyserver.server_port)
+    waits = []
+    limiter = RateLimiter(backoff=0.5, sleep=waits.append)
+    s = requests.Session()
+    s.mount('http://', GitHubAdapter(cache_dir=str(githubenv['REVER_DIR']),
+                                     limiter=limiter))
+    # a POST may have been acted on by the server, so it is not sent again
+    r = s.post(url, json={'tag_name': 'v1'})
+    assert r.status_code == 502
+    assert len(flakyserver.requests) == 1
+    assert waits == []
+    # but rate limited POSTs are
+    r = s.post(url, json={'tag_name': 'v1'})
+    assert r.status_code == 200
+    assert len(flakyserver.requests) == 3
+    assert waits == [7.0]
+
+
+def test_rate_limit_connection_error(githubenv):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    url = 'http://127.0.0.1:{0}/repos/wakka/jawaka'.format(sock.getsockname()[1])
+    sock.close()
+    waits = []
+    limiter = RateLimiter(max_retries=2, sleep=waits.append)
+    s = requests.Session()
+    s.mount('http://', GitHubAdapter(cache_dir=str(githubenv['REVER_DIR']),
+                                     limiter=limiter))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        s.post(url, json={})
+    assert waits == []
+    with pytest.raises(requests.exceptions.ConnectionError):
+        s.get(url)
+    assert len(waits) == 2
+
+
+def test_session_mounts_uploads(githubenv):
+    s = session()
+    assert isinstance(s.get_adapter('https://api.github.com/repos'), GitHubAdapter)
+    assert isinstance(s.get_adapter('https://uploads.github.com/repos/a/b/releases'),
+                      GitHubAdapter)
+
+
+def test_rate_limit_pacing():
+    limiter = RateLimiter(sleep=None)
+    assert limiter.delay('core') == 0.0
+    limiter.limits['core'] = {'limit': 5000, 'remaining': 4000,
+                              'reset': int(time.time()) + 100}
+    assert limiter.delay('core') == 0.0
+    # below 10% of the limit, the remaining requests are spread out
+    limiter.limits['core']['remaining'] = 9
+    assert 8.0 < limiter.delay('core') <= 10.0
+    # out of requests, wait for the reset
+    limiter.limits['core']['remaining'] = 0
+    assert 99.0 < limiter.delay('core') <= 101.0
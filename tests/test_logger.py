@@ -1,8 +1,11 @@
 """Tests logger"""
 import os
+import builtins
+
+import pytest
 
 from rever import vcsutils
-from rever.logger import Logger
+from rever.logger import Logger, SQLiteLogger
 
 
 def test_logger(gitrepo):
@@ -22,3 +25,101 @@ def test_logger(gitrepo):
     assert entry['category'] == "chippin'"
     assert entry['rev'] == vcsutils.current_rev()
     assert entries[0]['timestamp'] < entries[1]['timestamp']
+
+
+def test_sqlite_logger(gitrepo):
+    logger = SQLiteLogger(os.path.join(gitrepo, 'mylog.db'))
+    logger.log('sample message', activity="kenny", category="loggin'",
+               data={'start_rev': 'abc'}, version='1.0')
+    logger.log('another message', activity="wood", category="chippin'",
+               version='1.1')
+    logger.log('no activity', version='1.1')
+    entries = logger.load()
+    assert len(entries) == 3
+    entry = entries[0]
+    assert entry['message'] == 'sample message'
+    assert entry['activity'] == 'kenny'
+    assert entry['category'] == "loggin'"
+    assert entry['data'] == {'start_rev': 'abc'}
+    assert entry['version'] == '1.0'
+    assert entry['rev'] == vcsutils.current_rev()
+    assert 'activity' not in entries[2]
+    assert 'data' not in entries[2]
+    assert entries[0]['timestamp'] < entries[1]['timestamp']
+
+
+@pytest.mark.parametrize('cls', [Logger, SQLiteLogger])
+def test_query(gitrepo, cls):
+    logger = cls(os.path.join(gitrepo, 'mylog' + ('.db' if cls is SQLiteLogger else '.json')))
+    assert logger.query(activity='a') == []
+    logger.log('a start', activity='a', category='activity-start', version='1.0')
+    logger.log('a end', activity='a', category='activity-end', version='1.0')
+    logger.log('b end', activity='b', category='activity-end', version='1.0')
+    logger.log('a end', activity='a', category='activity-end', version='2.0')
+    obs = [e['message'] for e in logger.query(activity='a')]
+    assert obs == ['a start', 'a end', 'a end']
+    obs = [e['activity'] for e in logger.query(category='activity-end', version='1.0')]
+    assert obs == ['a', 'b']
+    entries = logger.load()
+    since = entries[2]['timestamp']
+    obs = [e['version'] for e in logger.query(activity='a', since=since)]
+    assert obs == ['2.0']
+    obs = [e['activity'] for e in logger.query(until=entries[1]['timestamp'])]
+    assert obs == ['a', 'a']
+
+
+def test_to_logger(gitrepo):
+    env = builtins.__xonsh__.env
+    orig = env['LOGGER']
+    env['LOGGER'] = 'other.json'
+    assert env['LOGGER'] is orig
+    env['LOGGER'] = 'rever.db'
+    assert isinstance(env['LOGGER'], SQLiteLogger)
+    assert env['LOGGER'].filename.endswith('rever.db')
+    env['LOGGER'] = orig
+    orig.filename = 'rever.log'
+
+
+def nlines(fname):
+    if not os.path.isfile(fname):
+        return 0
+    with open(fname) as f:
+        return len(f.readlines())
+
+
+def test_buffered_writes(gitrepo):
+    fname = os.path.join(gitrepo, 'mylog.json')
+    logger = Logger(fname, flush_interval=3600.0)
+    logger.log('one', activity='a', category='activity-start')
+    logger.log('two', activity='a')
+    assert nlines(fname) == 0
+    # activity boundaries flush the buffer
+    logger.log('three', activity='a', category='activity-end')
+    assert nlines(fname) == 3
+    logger.log('four', activity='b', category='activity-start')
+    assert nlines(fname) == 3
+    # reading the log flushes the buffer
+    assert [e['message'] for e in logger.load()] == ['one', 'two', 'three', 'four']
+    assert nlines(fname) == 4
+    logger.flush_interval = 0.0
+    logger.log('five')
+    assert nlines(fname) == 5
+    logger.close()
+
+
+@pytest.mark.parametrize('durability', ['none', 'flush', 'fsync'])
+@pytest.mark.parametrize('cls, ext', [(Logger, '.json'), (SQLiteLogger, '.db')])
+def test_durability(gitrepo, cls, ext, durability):
+    logger = cls(os.path.join(gitrepo, 'mylog' + ext), durability=durability,
+                 flush_interval=3600.0)
+    for i in range(10):
+        logger.log(str(i), activity='a', version='1.0')
+    logger.close()
+    logger = cls(os.path.join(gitrepo, 'mylog' + ext))
+    assert [e['message'] for e in logger.load()] == [str(i) for i in range(10)]
+    logger.close()
+
+
+def test_bad_durability(gitrepo):
+    with pytest.raises(ValueError):
+        Logger('mylog.json', durability='sometimes')
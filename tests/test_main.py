@@ -1,5 +1,11 @@
 """Test main utilities"""
 import os
+import re
+import sys
+import json
+import stat
+import time
+import subprocess
 from collections import defaultdict
 import builtins
 
@@ -7,6 +13,8 @@ from rever.activity import Activity
 from rever.main import (env_main, compute_activities_completed,
                         compute_activities_to_run)
 from rever.logger import current_logger
+from rever.vcsutils import current_branch
+from rever.docker import load_images_used, mark_image_used
 
 
 def test_source_rc(gitrepo):
@@ -217,3 +225,306 @@ def test_compute_activities_completed(gitrepo):
     assert compute_activities_completed() == {'a'}
     env['VERSION'] = 'x.y.zz'
     assert compute_activities_completed() == set()
+
+
+def test_log_subcommand(gitrepo, capsys):
+    with open('rever.xsh', 'w') as f:
+        f.write(EMPTY_REVER_XSH)
+    env = builtins.__xonsh__.env
+    dag = env['DAG']
+    dag['a'] = Activity(name='a')
+    dag['b'] = Activity(name='b')
+    env_main(args=['--activities', 'a,b', 'x.y.z'])
+    env_main(args=['--activities', 'a', 'x.y.zz'])
+    capsys.readouterr()
+    env_main(args=['log', '--json', '-a', 'a', '-c', 'activity-end'])
+    lines = capsys.readouterr().out.splitlines()
+    entries = [json.loads(line) for line in lines]
+    assert [e['version'] for e in entries] == ['x.y.z', 'x.y.zz']
+    env_main(args=['log', '--json', '-V', 'x.y.z', '-c', 'activity-end', '-n', '1'])
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)['activity'] for line in lines] == ['b']
+
+
+def test_report_subcommand(gitrepo, capsys):
+    with open('rever.xsh', 'w') as f:
+        f.write(EMPTY_REVER_XSH)
+    env = builtins.__xonsh__.env
+    dag = env['DAG']
+    dag['a'] = Activity(name='a')
+    env_main(args=['--activities', 'a', 'x.y.z'])
+    env_main(args=['--activities', 'a', 'x.y.zz'])
+    capsys.readouterr()
+    env_main(args=['report', 'x.y.zz'])
+    out = capsys.readouterr().out
+    assert 'x.y.z' in out
+    lines = out.splitlines()
+    assert lines[-3].split() == ['activity', 'wall', 'cpu', 'procs', 'previous', 'change']
+    # the row is red, if it regressed
+    cols = re.sub(r'\x1b\[\d+m', '', lines[-2]).split()
+    assert len(cols) == 6
+    assert cols[0] == 'a'
+    assert all(col.endswith('s') for col in cols[1:3] + cols[4:5])
+    assert cols[3] == '0'
+    assert cols[5] == '-' or cols[5].endswith('%')
+    assert lines[-1].split()[0] == 'total'
+
+
+def test_plan(gitrepo, capsys):
+    with open('rever.xsh', 'w') as f:
+        f.write(EMPTY_REVER_XSH)
+    env = builtins.__xonsh__.env
+    dag = env['DAG']
+    dag['a'] = Activity(name='a')
+    dag['b'] = Activity(name='b', deps={'a'})
+    env_main(args=['--activities', 'a', 'x.y.z'])
+    capsys.readouterr()
+    env_main(args=['--plan', '--activities', 'a,b', 'x.y.zz'])
+    out = capsys.readouterr().out
+    assert 'No timing history for b' in out
+    lines = out.splitlines()
+    assert lines[-2].startswith('predicted total: ')
+    assert lines[-1].startswith('critical path: a -> b (')
+    # nothing was run
+    assert compute_activities_completed() == set()
+
+
+def test_plan_does_not_reorder(gitrepo, capsys):
+    with open('rever.xsh', 'w') as f:
+        f.write(EMPTY_REVER_XSH)
+    env = builtins.__xonsh__.env
+    dag = env['DAG']
+    dag['a'] = Activity(name='a')
+    dag['b'] = Activity(name='b', func=lambda: time.sleep(0.2))
+    env_main(args=['--activities', 'a,b', 'x.y.z'])
+    capsys.readouterr()
+    # the plan puts the longer activity first
+    env_main(args=['--plan', '--activities', 'a,b', 'x.y.zz'])
+    out = capsys.readouterr().out
+    assert 'the release does not reorder the activities' in out
+    rows = [re.sub(r'\x1b\[[\d;]*m', '', line).split() for line in out.splitlines()]
+    assert [row[1] for row in rows if row[:1] in (['1'], ['2'])] == ['b', 'a']
+    # but the release runs them in the $ACTIVITIES order
+    env_main(args=['--activities', 'a,b', 'x.y.zz'])
+    ends = current_logger().query(category='activity-end', version='x.y.zz')
+    assert [e['activity'] for e in ends] == ['a', 'b']
+
+
+TRACED = """$ACTIVITIES = ['traced']
+from rever.activity import activity
+
+@activity
+def traced():
+    git commit --allow-empty -m 'traced'
+"""
+
+
+def test_trace(gitrepo):
+    with open('rever.xsh', 'w') as f:
+        f.write(TRACED)
+    env = builtins.__xonsh__.env
+    env_main(args=['--trace', 'x.y.z'])
+    fname = os.path.join(gitrepo, env['REVER_DIR'], 'trace-x.y.z.json')
+    with open(fname) as f:
+        events = json.load(f)['traceEvents']
+    spans = {e['name']: e for e in events if e['ph'] == 'X'}
+    run, act, func = spans['rever run'], spans['traced'], spans['func']
+    assert act['args'] == {'version': 'x.y.z', 'status': 'success'}
+    commit = spans['git commit']
+    assert commit['cat'] == 'subprocess'
+    assert commit['args']['returncode'] == 0
+    # spans are nested
+    for outer, inner in [(run, act), (act, func), (func, commit)]:
+        assert outer['ts'] <= inner['ts']
+        assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+
+
+BATCHED = """$ACTIVITIES = ['touch']
+from rever.activity import activity
+
+@activity
+def touch():
+    with open('touched', 'w') as f:
+        f.write($VERSION)
+"""
+
+
+def test_batch(gitrepo, capsys):
+    with open('rever.xsh', 'w') as f:
+        f.write(BATCHED)
+    with open('.gitignore', 'w') as f:
+        f.write('rever/\n')
+    subprocess.run(['git', 'add', '.'])
+    subprocess.run(['git', 'commit', '-am', 'add rc'])
+    subprocess.run(['git', 'branch', 'maint'])
+    branch = current_branch()
+    # a stale worktree left over from an earlier batch is made again
+    subprocess.run(['git', 'worktree', 'add', '--detach',
+                    os.path.join('rever', 'worktrees', '1.0'), 'HEAD~1'])
+    env_main(args=['batch', '1.0@maint', '2.0@' + branch])
+    out = capsys.readouterr().out
+    # each release ran in its own checkout, which is removed afterwards
+    with open(os.path.join(gitrepo, 'touched')) as f:
+        assert f.read() == '2.0'
+    assert not os.path.exists(os.path.join(gitrepo, 'rever', 'worktrees', '1.0'))
+    worktrees = subprocess.run(['git', 'worktree', 'list'], stdout=subprocess.PIPE,
+                               universal_newlines=True).stdout
+    assert len(worktrees.splitlines()) == 1
+    # and they share the log
+    logger = current_logger()
+    head = subprocess.run(['git', 'rev-parse', 'maint'], stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+    for version in ['1.0', '2.0']:
+        ends = logger.query(category='activity-end', version=version)
+        assert [e['activity'] for e in ends] == ['touch']
+        assert ends[0]['rev'] == head
+    lines = out.splitlines()
+    assert lines[-3].split()[:2] == ['version', 'branch']
+    assert lines[-2].split()[:5] == ['1.0', 'maint', 'success', '1', '0']
+    assert lines[-1].split()[:5] == ['2.0', branch, 'success', '1', '0']
+    assert os.path.isfile(os.path.join(gitrepo, 'rever', 'batch', '1.0.out'))
+
+
+def test_batch_worktree_failure(gitrepo, capsys):
+    with open('rever.xsh', 'w') as f:
+        f.write(BATCHED)
+    with open('.gitignore', 'w') as f:
+        f.write('rever/\n')
+    subprocess.run(['git', 'add', '.'])
+    subprocess.run(['git', 'commit', '-am', 'add rc'])
+    # the branch is already checked out elsewhere, so it cannot get a worktree
+    other = gitrepo + '-other'
+    subprocess.run(['git', 'worktree', 'add', '-b', 'maint', other])
+    branch = current_branch()
+    try:
+        env_main(args=['batch', '1.0@maint', '2.0@' + branch])
+        assert False, 'the batch should have failed'
+    except SystemExit as e:
+        assert e.code == 1
+    finally:
+        subprocess.run(['git', 'worktree', 'remove', '--force', other])
+    out = capsys.readouterr().out
+    lines = out.splitlines()
+    assert lines[-2].split()[1:3] == ['maint', 'failed']
+    assert lines[-1].split()[:3] == ['2.0', branch, 'success']
+    assert not current_logger().query(category='activity-end', version='1.0')
+    with open(os.path.join(gitrepo, 'rever', 'batch', '1.0.out')) as f:
+        assert 'worktree add' in f.read()
+
+
+def test_monorepo(gitrepo, capsys):
+    for name in ['a', os.path.join('pkgs', 'b')]:
+        os.makedirs(name)
+        with open(os.path.join(name, 'rever.xsh'), 'w') as f:
+            f.write(BATCHED)
+    with open(os.path.join('a', 'rever.xsh'), 'a') as f:
+        f.write('$YOU_DONT = "always"\n')
+    env_main(args=['monorepo', '1.0'])
+    out = capsys.readouterr().out
+    # projects run in their own directories, with their own logs
+    for name in ['a', os.path.join('pkgs', 'b')]:
+        with open(os.path.join(name, 'touched')) as f:
+            assert f.read() == '1.0'
+        logfile = os.path.join(gitrepo, name, 'rever', 'rever.log')
+        with open(logfile) as f:
+            ends = [json.loads(line) for line in f
+                    if '"activity-end"' in line]
+        assert [e['activity'] for e in ends] == ['touch']
+    # and in isolated environments
+    assert 'YOU_DONT' not in builtins.__xonsh__.env
+    lines = out.splitlines()
+    assert lines[-1] == '2 of 2 projects released'
+    assert lines[-3].split()[:2] == ['a', 'success']
+    assert lines[-2].split()[:2] == [os.path.join('pkgs', 'b'), 'success']
+
+
+FAKE_DOCKER = """#!{python}
+import sys, json
+state = {state!r}
+with open(state) as f:
+    images = json.load(f)
+args = sys.argv[1:]
+with open(state + '.calls', 'a') as f:
+    f.write(' '.join(args) + '\\n')
+if args[:2] == ['image', 'ls']:
+    print('\\n'.join(images))
+elif args[:2] == ['image', 'inspect']:
+    if args[2] == '--format':
+        ids = [i for i, img in images.items() if args[4] in img['RepoTags']]
+        sys.exit(print(ids[0]) if ids else 1)
+    print(json.dumps([images[i] for i in args[2:]]))
+elif args[:2] == ['image', 'rm']:
+    ids = [i for i, img in images.items() if img['RepoTags'] == args[2:]]
+    if ids[0] == 'sha256:busy':
+        sys.exit('image is being used by a running container')
+    del images[ids[0]]
+    with open(state, 'w') as f:
+        json.dump(images, f)
+"""
+
+
+def image(i, tag, size, built):
+    return {'Id': i, 'RepoTags': [tag], 'Size': size, 'Created': built,
+            'Config': {'Labels': {'org.regro.rever.project': 'rever',
+                                  'org.regro.rever.built': built}}}
+
+
+def write_fake_docker(d):
+    state = os.path.join(d, 'images.json')
+    images = [image('sha256:old', 'rever/rever-base:latest', 6 * 10**9,
+                    '2020-01-01T00:00:00Z'),
+              image('sha256:busy', 'rever:0.9', 6 * 10**9, '2021-01-01T00:00:00Z'),
+              image('sha256:mid', 'rever:1.0', 6 * 10**9, '2022-01-01T00:00:00Z'),
+              image('sha256:new', 'rever:1.1', 6 * 10**9, '2023-01-01T00:00:00Z')]
+    with open(state, 'w') as f:
+        json.dump({img['Id']: img for img in images}, f)
+    bindir = os.path.join(d, 'bin')
+    os.makedirs(bindir)
+    docker = os.path.join(bindir, 'docker')
+    with open(docker, 'w') as f:
+        f.write(FAKE_DOCKER.format(python=sys.executable, state=state))
+    os.chmod(docker, os.stat(docker).st_mode | stat.S_IEXEC)
+    return state, bindir
+
+
+def test_docker_gc(gitrepo, capsys):
+    state, bindir = write_fake_docker(gitrepo)
+    with open('rever.xsh', 'w') as f:
+        f.write('$PATH.insert(0, {0!r})\n'.format(bindir))
+        f.write('$DOCKER_GC_BUDGET = "18GB"\n')
+    # the oldest image was used recently, so it is kept
+    cache = os.path.join(gitrepo, 'rever', 'cache')
+    os.makedirs(cache)
+    with open(os.path.join(cache, 'docker-images.json'), 'w') as f:
+        json.dump({'sha256:old': 2e9}, f)
+    env_main(args=['docker-gc', '--dry-run'])
+    out = capsys.readouterr().out
+    assert 'would remove' in out
+    with open(state) as f:
+        assert len(json.load(f)) == 4
+    env_main(args=['docker-gc'])
+    out = capsys.readouterr().out
+    with open(state) as f:
+        assert sorted(json.load(f)) == ['sha256:busy', 'sha256:new', 'sha256:old']
+    assert out.splitlines()[-1] == '1 images removed, rever images use 18.0GB of 18.0GB'
+    with open(state + '.calls') as f:
+        calls = f.read().splitlines()
+    assert calls[-1] == 'builder prune --force --keep-storage 0'
+
+
+def test_mark_image_used(gitrepo, monkeypatch):
+    state, bindir = write_fake_docker(gitrepo)
+    env = builtins.__xonsh__.env
+    monkeypatch.setitem(env, 'PATH', [bindir] + list(env['PATH']))
+    monkeypatch.setattr('rever.docker._MARKED_USED', set())
+    mark_image_used('rever:1.0')
+    mark_image_used('rever:1.0')
+    with open(state + '.calls') as f:
+        assert f.read().count('image inspect --format') == 1
+    # a rebuilt image is always recorded again
+    mark_image_used('rever:1.0', force=True)
+    with open(state + '.calls') as f:
+        assert f.read().count('image inspect --format') == 2
+    cache = os.path.join(gitrepo, 'rever', 'cache')
+    assert list(load_images_used()) == ['sha256:mid']
+    assert sorted(os.listdir(cache)) == ['docker-images.json', 'docker-images.json.lock']
@@ -0,0 +1,87 @@
+"""Timing tests"""
+import os
+import sys
+import threading
+import subprocess
+
+import pytest
+
+from rever.timing import (Timer, activity_timings, median_durations, timing_report,
+    format_duration)
+
+
+def end(activity, version, wall, timestamp):
+    return {'activity': activity, 'version': version, 'category': 'activity-end',
+            'timestamp': timestamp, 'message': '',
+            'data': {'start_rev': 'abc', 'wall_time': wall, 'cpu_time': 0.5,
+                     'subprocesses': 2}}
+
+
+ENTRIES = [
+    end('a', '1.0', 10.0, 1.0),
+    end('b', '1.0', 2.0, 2.0),
+    {'activity': 'a', 'version': '1.0', 'category': 'activity-start',
+     'timestamp': 2.5, 'message': ''},
+    end('a', '1.1', 12.0, 3.0),
+    end('b', '1.1', 4.0, 4.0),
+    # no timing data for old log entries
+    {'activity': 'b', 'version': '1.2', 'category': 'activity-end',
+     'timestamp': 4.5, 'message': '', 'data': {'start_rev': 'abc'}},
+    end('a', '1.2', 14.0, 5.0),
+    end('b', '1.2', 2.0, 6.0),
+    end('c', '1.2', 1.0, 7.0),
+]
+
+
+def test_timer():
+    with Timer() as timer:
+        pass
+    assert timer.data['wall_time'] >= 0.0
+    assert timer.data['subprocesses'] == 0
+
+
+@pytest.mark.skipif(not hasattr(sys, 'addaudithook'), reason='no audit hooks')
+def test_timer_subprocesses():
+    with Timer() as timer:
+        # processes started with subprocess from other threads are counted too
+        t = threading.Thread(target=subprocess.run, args=([sys.executable, '-c', ''],))
+        t.start()
+        t.join()
+        # the shell is the process that is started
+        subprocess.run('exit 0', shell=True)
+    assert timer.data['subprocess_counts'] == {os.path.basename(sys.executable): 1,
+                                               'sh': 1}
+    assert timer.data['subprocesses'] == 2
+
+
+def test_activity_timings():
+    timings = activity_timings(ENTRIES)
+    assert list(timings.keys()) == ['1.0', '1.1', '1.2']
+    assert timings['1.2']['b']['wall_time'] == 2.0
+    assert median_durations(timings) == {'a': 12.0, 'b': 2.0, 'c': 1.0}
+    assert median_durations(timings, exclude={'1.2'}) == {'a': 11.0, 'b': 3.0}
+
+
+def test_timing_report():
+    rows, prev = timing_report('1.2', ENTRIES, threshold=0.2)
+    assert prev == ['1.1', '1.0']
+    rows = {row['activity']: row for row in rows}
+    assert rows['a']['previous'] == 11.0
+    assert rows['a']['change'] == pytest.approx(3.0 / 11.0)
+    assert rows['a']['regressed']
+    assert not rows['b']['regressed']
+    assert rows['c']['previous'] is None
+    assert not rows['c']['regressed']
+    rows, prev = timing_report('1.2', ENTRIES, previous=1)
+    assert prev == ['1.1']
+    assert timing_report('2.0', ENTRIES) == ([], [])
+
+
+@pytest.mark.parametrize('t, exp', [
+    (None, '-'),
+    (1.234, '1.23s'),
+    (125.0, '2m05s'),
+    (7300.0, '2h01m'),
+])
+def test_format_duration(t, exp):
+    assert format_duration(t) == exp
@@ -1,10 +1,14 @@
 """Rever tools tests"""
 import os
+import hashlib
 import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 import pytest
 
-from rever.tools import indir, render_authors, hash_url, replace_in_file
+from rever.tools import (indir, render_authors, hash_url, replace_in_file,
+    replace_in_files, match_files, download_file, download_bytes)
 
 @pytest.mark.parametrize('inp, pattern, new, leading_whitespace, exp', [
     ('__version__ = "wow.mom"', r'__version__\s*=.*', '__version__ = "WAKKA"',
@@ -43,3 +47,147 @@ def test_hash_url_http():
 
 def test_hash_url_ftp():
     hash_url('ftp://ftp.astron.com/pub/file/file-5.33.tar.gz')
+
+
+def test_replace_in_files():
+    with tempfile.TemporaryDirectory() as d:
+        a = os.path.join(d, 'a.py')
+        b = os.path.join(d, 'b.py')
+        with open(a, 'w') as f:
+            f.write('version = "1.0"\n  number = 1\n')
+        with open(b, 'w') as f:
+            f.write('unchanged\n')
+        mtime = os.stat(b).st_mtime_ns
+        changed, unmatched = replace_in_files([
+            (a, r'version\s*=.*', 'version = "2.0"'),
+            (b, r'version\s*=.*', 'version = "2.0"'),
+            (a, r'number\s*=.*', 'number = 0\nheader'),
+            (a, r'header', 'footer'),
+            ])
+        assert changed == [a]
+        assert unmatched == [(b, r'version\s*=.*', 'version = "2.0"')]
+        with open(a) as f:
+            assert f.read() == 'version = "2.0"\n  number = 0\nfooter\n'
+        # files without matches are not rewritten
+        assert os.stat(b).st_mtime_ns == mtime
+        assert sorted(os.listdir(d)) == ['a.py', 'b.py']
+
+
+@pytest.mark.parametrize('pattern, exp', [
+    ('*.json', ['package.json']),
+    ('**/package.json', ['package.json', 'a/package.json', 'a/b/package.json']),
+    ('a/*/package.json', ['a/b/package.json']),
+    ('a/**', ['a/package.json', 'a/b/package.json', 'a/b/Cargo.toml']),
+    ('**/[CX]argo.tom?', ['a/b/Cargo.toml']),
+    ('**/[!C]*.toml', []),
+])
+def test_match_files(pattern, exp):
+    files = ['package.json', 'a/package.json', 'a/b/package.json',
+             'a/b/Cargo.toml']
+    assert match_files(pattern, files) == exp
+
+
+DATA = bytes(range(256)) * 4096
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves DATA with byte ranges. The first response is cut short."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def send_headers(self, status, length, start=None, end=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"data"')
+        if start is not None:
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end,
+                                                                         len(DATA)))
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_headers(200, len(DATA))
+
+    def do_GET(self):
+        rng = self.headers.get('Range', None)
+        self.server.ranges.append(rng)
+        if rng is None:
+            start, end = 0, len(DATA) - 1
+            self.send_headers(200, len(DATA))
+        else:
+            assert self.headers['If-Range'] == '"data"'
+            first, _, last = rng[len('bytes='):].partition('-')
+            start, end = int(first), int(last or len(DATA) - 1)
+            self.send_headers(206, end - start + 1, start, end)
+        body = DATA[start:end+1]
+        if len(self.server.ranges) == 1 and self.server.drop:
+            self.wfile.write(body[:len(body)//3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rangeserver():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.ranges = []
+    server.drop = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_resume(rangeserver):
+    url = 'http://127.0.0.1:{0}/data'.format(rangeserver.server_port)
+    expected = 'sha256:' + hashlib.sha256(DATA).hexdigest()
+    with tempfile.TemporaryDirectory() as d:
+        dest = os.path.join(d, 'data')
+        fname, digest = download_file(url, dest, expected=expected, parts=1, quiet=True)
+        assert fname == dest
+        with open(dest, 'rb') as f:
+            assert f.read() == DATA
+        assert not os.path.exists(dest + '.part')
+    # the interrupted download is resumed where it was cut off
+    assert rangeserver.ranges[0] is None
+    assert rangeserver.ranges[1].startswith('bytes=')
+    assert int(rangeserver.ranges[1][6:-1]) > 0
+
+
+def test_download_parallel_ranges(rangeserver):
+    rangeserver.drop = False
+    url = 'http://127.0.0.1:{0}/data'.format(rangeserver.server_port)
+    assert download_bytes(url, parts=4, part_size=1024, quiet=True) == DATA
+    assert len(rangeserver.ranges) == 4
+    assert 'bytes=0-262143' in rangeserver.ranges
+
+
+def test_download_bad_digest(rangeserver):
+    rangeserver.drop = False
+    url = 'http://127.0.0.1:{0}/data'.format(rangeserver.server_port)
+    with tempfile.TemporaryDirectory() as d:
+        dest = os.path.join(d, 'data')
+        with pytest.raises(ValueError):
+            download_file(url, dest, expected='0' * 64, quiet=True)
+        assert os.listdir(d) == []
+
+
+def test_download_digest_algorithm(rangeserver):
+    rangeserver.drop = False
+    url = 'http://127.0.0.1:{0}/data'.format(rangeserver.server_port)
+    md5 = 'md5:' + hashlib.md5(DATA).hexdigest()
+    with tempfile.TemporaryDirectory() as d:
+        dest = os.path.join(d, 'data')
+        # the prefix is verified, but the digest is still the default sha256
+        fname, digest = download_file(url, dest, expected=md5, quiet=True)
+        assert digest == hashlib.sha256(DATA).hexdigest()
+        # an explicit hash that disagrees with the prefix is an error
+        with pytest.raises(ValueError, match='md5'):
+            download_file(url, dest, expected=md5, hash='sha1', quiet=True)
+        fname, digest = download_file(url, dest, expected=md5, hash='md5', quiet=True)
+        assert digest == md5[4:]
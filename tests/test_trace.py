@@ -0,0 +1,46 @@
+"""Tracing tests"""
+import os
+import json
+
+from rever.vcsutils import current_rev
+from rever.trace import Tracer, tracing, span, current_tracer
+
+
+def test_tracer_span(tmpdir):
+    tracer = Tracer(name='rever test')
+    with tracer.span('outer', cat='activity') as args:
+        with tracer.span('inner', cat='func', x=1):
+            pass
+        args['status'] = 'success'
+    inner, outer = tracer.events
+    assert outer['name'] == 'outer'
+    assert outer['ph'] == 'X'
+    assert outer['args'] == {'status': 'success'}
+    assert inner['args'] == {'x': 1}
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+    meta = tracer.trace_events()[0]
+    assert meta['ph'] == 'M'
+    assert meta['args']['name'] == 'rever test'
+
+
+def test_span_not_tracing():
+    assert current_tracer() is None
+    with span('nothing') as args:
+        args['status'] = 'ignored'
+
+
+def test_tracing_appends(gitrepo):
+    fname = os.path.join(gitrepo, 'rever', 'trace.json')
+    for i in range(2):
+        with tracing(fname, name='rever run') as tracer:
+            assert current_tracer() is tracer
+            with span('act', cat='activity'):
+                current_rev()
+    assert current_tracer() is None
+    with open(fname) as f:
+        trace = json.load(f)
+    names = [e['name'] for e in trace['traceEvents'] if e['ph'] == 'X']
+    assert names.count('rever run') == 2
+    assert names.count('act') == 2
+    assert names.count('git rev-parse') == 2
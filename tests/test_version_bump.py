@@ -1,4 +1,7 @@
 """Tests the version bumper activity."""
+import os
+import re
+
 from rever import vcsutils
 from rever.logger import current_logger
 from rever.main import env_main
@@ -36,3 +39,65 @@ def test_version_bump(gitrepo):
     logger = current_logger()
     entries = logger.load()
     assert entries[-2]['rev'] != entries[-1]['rev']
+
+
+GLOB_XSH = """
+$ACTIVITIES = ['version_bump']
+
+$DAG['version_bump'].args = [[
+    ('**/package.json', r'"version":.*', '"version": "$VERSION",'),
+    ('**/*.toml', r'version\\s*=.*', 'version = "$VERSION"'),
+]]
+"""
+PACKAGE_JSON = """{
+  "name": "pkg",
+  "version": "42.1.0",
+}
+"""
+
+
+def test_version_bump_glob(gitrepo, capsys):
+    files = [('rever.xsh', GLOB_XSH), ('package.json', PACKAGE_JSON),
+             ('a/package.json', PACKAGE_JSON), ('b/c/package.json', PACKAGE_JSON),
+             ('ignored/package.json', PACKAGE_JSON),
+             ('.gitignore', 'ignored/\n')]
+    for filename, body in files:
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as f:
+            f.write(body)
+    vcsutils.track('.')
+    vcsutils.commit('Some versioned files')
+    env_main(['42.1.1'])
+    for filename in ['package.json', 'a/package.json', 'b/c/package.json']:
+        with open(filename) as f:
+            assert '"version": "42.1.1",' in f.read()
+    # ignored files are left alone
+    with open('ignored/package.json') as f:
+        assert f.read() == PACKAGE_JSON
+    out, err = capsys.readouterr()
+    assert re.search(r'bumped version in \S*3\S* of 3 files', out) is not None
+    assert "no files match '**/*.toml'" in err
+
+
+LITERAL_XSH = """
+$ACTIVITIES = ['version_bump']
+
+$DAG['version_bump'].args = [[
+    ('pkg[1].py', r'__version__\\s*=.*', "__version__ = '$VERSION'"),
+]]
+"""
+
+
+def test_version_bump_literal_brackets(gitrepo):
+    # an existing file is not a glob, even though its name would match pkg1.py
+    files = [('rever.xsh', LITERAL_XSH), ('pkg[1].py', INIT_PY), ('pkg1.py', INIT_PY)]
+    for filename, body in files:
+        with open(filename, 'w') as f:
+            f.write(body)
+    vcsutils.track('.')
+    vcsutils.commit('Some versioned files')
+    env_main(['42.1.1'])
+    with open('pkg[1].py') as f:
+        assert f.read() == "__version__ = '42.1.1'\n"
+    with open('pkg1.py') as f:
+        assert f.read() == INIT_PY